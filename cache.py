@@ -0,0 +1,74 @@
+"""
+Cache
+"""
+
+import hashlib
+import json
+import pathlib
+import time
+from typing import Optional
+
+import orjson
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class ResponseCache:
+    """
+    A disk cache of the raw OpenAI responses, each one is saved in a JSON file
+    named by the SHA-256 of the request.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        """Get the cache key of the request."""
+        # It is not orjson to keep the keys of the saved responses
+        content = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def is_cacheable(request: dict) -> bool:
+        """Check if the request is deterministic enough to be cached."""
+        return (request.get('temperature') or 0) <= 0
+
+    def get(self, request: dict) -> Optional[dict]:
+        """
+        Get the cached raw response of the request.
+
+        Args:
+            request (dict): The request parameters, e.g. model and messages.
+
+        Returns:
+            Optional[dict]: The raw response, or None if it is not cached or it
+                            is expired.
+        """
+        if not self.is_cacheable(request):
+            return None
+        path = self.directory / f'{self.make_key(request)}.json'
+        if not path.exists():
+            return None
+        if time.time() - path.stat().st_mtime > self.ttl_seconds:
+            return None
+        return orjson.loads(path.read_bytes())
+
+    def set(self, request: dict, raw_response: dict) -> None:
+        """
+        Save the raw response of the request.
+
+        Args:
+            request (dict): The request parameters, e.g. model and messages.
+            raw_response (dict): The raw response to save.
+        """
+        if not self.is_cacheable(request):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{self.make_key(request)}.json'
+        path.write_bytes(orjson.dumps(raw_response))
@@ -3,18 +3,42 @@ Do stuffs
 """
 
 import os
-import re
+import asyncio
+import logging
 import argparse
 import pathlib
 import json
+import sys
+import time
+import itertools
+from typing import Callable, Optional
 
+import anthropic
+import httpx
 import openai
-from openai.error import Timeout as TimeoutError
+from openai import AsyncOpenAI, OpenAI
 import inquirer
+import numpy as np
+import orjson
+import re2
 import pyperclip
+from pydantic import TypeAdapter
 from rich import print
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
 
-from schemas import Processment, Prompt, Response, RuneDefinition
+from cache import ResponseCache
+from semantic_cache import SemanticCache
+from schemas import (
+    Processment,
+    Response,
+    RuneDefinition,
+)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
@@ -22,16 +46,178 @@ if not OPENAI_API_KEY:
     print('Missing OPENAI_API_KEY environment')
     exit(-1)
 
-PROMPT_TO_GENERATE = '''Escribe 10 párrafos que sean variación del siguiente párrafo:
+PROMPT_SECTION = '### PROMPT'
 
-la runa {rune_name}{invert}: {text}
+RESPONSE_SECTION = '### RESPONSE'
 
-Pero no te salgas de la runa {rune_name}{invert}
+# The static instructions go first and they are the same in every request,
+# so OpenAI can reuse the cached prefix (it needs at least 1024 tokens and a
+# model of the gpt-4o family).
+SYSTEM_PROMPT = f'''Eres un asistente que escribe textos sobre las runas del futhark antiguo para un libro de adivinación. Cada mensaje del usuario te pide una de estas dos tareas, indicada en la línea "Tarea:", o varias de ellas en un mensaje de varios prompts.
+
+# Tarea: variaciones
+
+El mensaje trae el nombre de la runa en la línea "Runa:" y un párrafo que la describe en la línea "Texto:". Si la runa termina en "invertida", el párrafo describe la runa en su posición invertida y tus párrafos también deben hacerlo.
+
+Escribe 10 párrafos que sean variación del párrafo dado:
+- Cada párrafo conserva el significado del original, pero con otras palabras, otro orden de las ideas y otro tono.
+- No te salgas de la runa indicada: no menciones otras runas ni agregues significados que no estén en el texto.
+- Cada párrafo tiene entre una y tres oraciones, y se entiende por sí solo.
+- Escribe en español neutro, en segunda persona cuando el texto original hable al consultante.
+
+# Tarea: resumen
+
+El mensaje trae un párrafo en la línea "Texto:". Resume bien resumido ese párrafo, en una sola oración corta, sin agregar nada más que no esté en el párrafo.
+
+# Formato de la respuesta
+
+- Para las variaciones: exactamente 10 líneas numeradas del "1." al "10.", una por párrafo, sin títulos, sin comillas, sin líneas vacías entre ellas y sin ningún texto antes o después.
+- Para el resumen: solo la oración del resumen, sin comillas, sin numerarla y sin prefijos como "Resumen:".
+
+# Varios prompts
+
+Si el mensaje trae varios prompts, cada uno empieza con una línea "{PROMPT_SECTION} k" y tiene su propia línea "Tarea:". Responde todos, cada uno según su tarea y con su formato, y empieza cada respuesta con una línea "{RESPONSE_SECTION} k" con el mismo número k. Estas líneas son el único texto permitido fuera de las respuestas: no te saltes ningún prompt, no los juntes y no agregues nada más.
+
+# Ejemplos
+
+## Ejemplo 1
+
+Usuario:
+Tarea: variaciones
+Runa: FEHU
+Texto: Fehu anuncia prosperidad material y ganancias merecidas; es momento de disfrutar lo obtenido con esfuerzo, pero también de compartirlo y administrarlo con prudencia.
+
+Asistente:
+1. Fehu te habla de prosperidad material y de ganancias que te has ganado; disfruta lo que conseguiste con esfuerzo, pero compártelo y adminístralo con prudencia.
+2. Con Fehu llegan la abundancia y los frutos de tu trabajo. Goza de ellos, aunque sin olvidar repartirlos y cuidarlos con sensatez.
+3. Esta runa señala ganancias merecidas y bienestar económico. Es tiempo de celebrar lo logrado y, a la vez, de administrarlo con cabeza.
+4. Fehu indica que la riqueza que buscabas está llegando gracias a tu esfuerzo; aprovéchala con generosidad y con prudencia.
+5. La prosperidad material es el mensaje de Fehu: lo que has obtenido trabajando es tuyo para disfrutarlo, compartirlo y cuidarlo.
+6. Fehu trae ganancias justas. Disfruta de lo que has cosechado, pero no lo derroches y recuerda compartirlo con los tuyos.
+7. Cuando aparece Fehu, el esfuerzo se convierte en recompensa material; celébralo, aunque administrando esos bienes con prudencia.
+8. Fehu anuncia un buen momento económico fruto de tu dedicación. Comparte lo obtenido y gestiónalo con sabiduría para que perdure.
+9. Esta runa promete abundancia merecida; es momento de disfrutar lo conseguido sin descuidar la generosidad ni la buena administración.
+10. Fehu te recuerda que la prosperidad lograda con trabajo se disfruta mejor cuando se comparte y se cuida con prudencia.
+
+## Ejemplo 2
+
+Usuario:
+Tarea: variaciones
+Runa: RAIDHO invertida
+Texto: Raidho invertida advierte sobre viajes complicados, retrasos y decisiones tomadas sin rumbo; conviene detenerse y replantear el camino antes de seguir.
+
+Asistente:
+1. Raidho invertida te advierte de viajes complicados y retrasos; antes de continuar, detente y replantea el camino que llevas.
+2. En su posición invertida, Raidho habla de contratiempos en el viaje y de decisiones sin rumbo. Haz una pausa y revisa tu dirección.
+3. Esta runa invertida anuncia demoras y trayectos difíciles. Conviene frenar y pensar de nuevo hacia dónde te diriges.
+4. Raidho invertida señala que avanzas sin un rumbo claro y que pueden surgir retrasos; tómate un momento para replantear tu ruta.
+5. Los viajes se complican y las decisiones se toman a ciegas cuando aparece Raidho invertida. Detente antes de dar el siguiente paso.
+6. Raidho invertida pide prudencia: hay retrasos y caminos enredados, así que es mejor parar y reconsiderar el rumbo.
+7. Con Raidho invertida, el viaje se vuelve difícil y las decisiones pierden dirección; replantea el camino antes de seguir adelante.
+8. Esta runa en posición invertida alerta sobre demoras y elecciones sin rumbo. Lo sabio es detenerse y trazar de nuevo la ruta.
+9. Raidho invertida muestra un trayecto lleno de obstáculos y retrasos; no sigas por inercia, detente y vuelve a pensar tu camino.
+10. Cuando Raidho sale invertida, el avance se complica y el rumbo se pierde; haz una pausa y replantea hacia dónde vas.
+
+## Ejemplo 3
+
+Usuario:
+Tarea: resumen
+Texto: Ansuz te invita a escuchar con atención los consejos que llegan a tu vida, porque a través de las palabras de otros, de los sueños y de las señales recibirás la inspiración que necesitas para tomar una buena decisión.
+
+Asistente:
+Escucha los consejos y señales que recibes, porque te inspirarán para decidir bien.
+
+## Ejemplo 4
+
+Usuario:
+Tarea: resumen
+Texto: Isa invertida indica que una situación que estaba congelada empieza a moverse; los bloqueos se disuelven poco a poco y vuelve la posibilidad de avanzar, aunque todavía con cautela.
+
+Asistente:
+Lo que estaba detenido empieza a moverse y puedes avanzar con cautela.
 '''
 
-PROMPT_TO_SUMMARY = '''Resume bien resumido este párrafo sin agregar nada más: {text}'''
+SYSTEM_MESSAGE = {'role': 'system', 'content': SYSTEM_PROMPT}
+
+PROMPT_TO_GENERATE = '''Tarea: variaciones
+Runa: {rune_name}{invert}
+Texto: {text}'''
+
+PROMPT_TO_SUMMARY = '''Tarea: resumen
+Texto: {text}'''
+
+PROMPT_TO_MERGE = f'''Responde por separado cada uno de los siguientes {{count}} prompts. Empieza cada respuesta con una línea "{RESPONSE_SECTION} k", donde k es el número del prompt, y no escribas nada más fuera de las respuestas.
+
+{{prompts}}
+'''
+
+# Only the numbering at the start of the line, with the linear time RE2 engine
+REGEX_ITEM = re2.compile(r'^\s*\d+\.\s*')
+
+REGEX_RESPONSE_SECTION = re2.compile(
+    rf'(?m)^\s*{re2.escape(RESPONSE_SECTION)}\s+(\d+)\s*$'
+)
+
+MODEL = 'gpt-4o-mini'
+
+EMBEDDING_MODEL = 'text-embedding-3-small'
+
+ANTHROPIC_MODEL = 'claude-3-5-sonnet-20241022'
+
+ANTHROPIC_MAX_TOKENS = 2048
+
+BATCH_POLL_SECONDS = 30
+
+# Each merged request must fit the answers of all its prompts in the reply
+MAX_MERGED_PROMPTS = 4
 
-REGEX_ITEM = re.compile(r'\d+\.')
+MAX_CONCURRENCY = 8
+
+MAX_RETRY_SECONDS = 60
+
+MAX_ATTEMPTS = 6
+
+REQUEST_TIMEOUT_SECONDS = 30
+
+CACHE_DIRECTORY = pathlib.Path('cache')
+
+RUNE_LIST_ADAPTER = TypeAdapter(list[RuneDefinition])
+
+# The retries are done by tenacity (retry_transient_errors), so the clients
+# must not retry
+client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    max_retries=0,
+    http_client=httpx.Client(http2=True),
+)
+
+async_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    max_retries=0,
+    http_client=httpx.AsyncClient(http2=True),
+)
+
+request_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+logger = logging.getLogger(__name__)
+
+# Retry the transient errors with an exponential backoff
+retry_transient_errors = retry(
+    wait=wait_exponential(multiplier=1, min=1, max=MAX_RETRY_SECONDS),
+    stop=stop_after_attempt(MAX_ATTEMPTS),
+    retry=retry_if_exception_type((
+        openai.APITimeoutError,
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        anthropic.APITimeoutError,
+        anthropic.RateLimitError,
+        anthropic.APIConnectionError,
+        anthropic.InternalServerError,
+    )),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
 
 
 def get_args():
@@ -51,8 +237,49 @@ def get_args():
         'target_path',
         help='The JSON file path to read the possible rune values',
     )
+    # How the prompts are asked
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--batch',
+        action='store_true',
+        help='Send all the prompts through the OpenAI Batch API without asking',
+    )
+    mode.add_argument(
+        '--merge',
+        action='store_true',
+        help='Merge the prompts in a few requests instead of one for each',
+    )
+    mode.add_argument(
+        '--stream',
+        action='store_true',
+        help='Ask the prompts one by one printing the responses while arriving',
+    )
+    parser.add_argument(
+        '--no-confirm',
+        action='store_true',
+        help='Ask all the runes without confirming and print the results',
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not use the cached responses of the previous runs',
+    )
+    parser.add_argument(
+        '--semantic-cache',
+        action='store_true',
+        help='Reuse the cached responses of similar prompts (needs embeddings)',
+    )
+    parser.add_argument(
+        '--anthropic',
+        action='store_true',
+        help='Ask to Anthropic instead of OpenAI (without the semantic cache)',
+    )
     # Parse the args
     args = parser.parse_args()
+    if args.stream and args.anthropic:
+        parser.error('--stream is only supported with OpenAI')
+    if args.batch and args.anthropic:
+        parser.error('--batch is only supported with OpenAI')
     return args
 
 
@@ -74,48 +301,465 @@ def load_json_file(target_path: str) -> list[RuneDefinition]:
     path = pathlib.Path(target_path)
     if not path.exists():
         raise FileNotFoundError(f'file is not found: {target_path}')
-    content = path.read_text(encoding='utf-8')
-    rune_json = json.loads(content)
-    return [RuneDefinition(**item) for item in rune_json]
+    rune_json = orjson.loads(path.read_bytes())
+    return RUNE_LIST_ADAPTER.validate_python(rune_json)
 
 
-def ask_openai(prompt: str) -> Response:
-    """Ask to OpenAI."""
-    prompt_messages = [
-        Prompt(role='system', content='You are a helpful assistant.'),
-        Prompt(role='user', content=prompt),
-    ]
+def build_messages(prompt: str) -> list[dict]:
+    """Build the chat messages to send for the given prompt."""
+    return [SYSTEM_MESSAGE, {'role': 'user', 'content': prompt}]
 
-    while True:
-        try:
-            raw_response: dict = openai.ChatCompletion.create(
-                model='gpt-3.5-turbo',
-                messages=[p.dict() for p in prompt_messages],
-            )
-        except TimeoutError as err:
-            print(err)
-            continue
-        break
-    response = Response(**raw_response)
+
+def build_alternatives_prompt(rune_definition: RuneDefinition) -> str:
+    """Build the prompt to generate the alternatives of a rune definition."""
+    rune_name = get_only_the_rune_name(rune_definition.rune_name)
+    return PROMPT_TO_GENERATE.format(
+        rune_name=rune_name,
+        invert=(
+            ' invertida'
+            if rune_definition.type == 'invert'
+            else ''
+            ),
+        text=rune_definition.description,
+    )
+
+
+def get_prompt_task(prompt: str) -> str:
+    """Get the task line of the prompt, like `Tarea: resumen`."""
+    return prompt.split('\n', 1)[0]
+
+
+@retry_transient_errors
+async def embed_prompt(prompt: str) -> np.ndarray:
+    """Get the embedding of the prompt."""
+    async with request_semaphore:
+        response = await async_client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=prompt,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+    return np.array(response.data[0].embedding, dtype=np.float32)
+
+
+@retry_transient_errors
+async def create_anthropic_message(
+    client: anthropic.AsyncAnthropic,
+    model: str,
+    system: dict,
+    messages: list[dict],
+) -> anthropic.types.Message:
+    """
+    Create an Anthropic message, the system message is marked as an ephemeral
+    cache breakpoint.
+
+    Each message takes its own slot of `MAX_CONCURRENCY` and it is retried
+    alone.
+    """
+    async with request_semaphore:
+        return await client.messages.create(
+            model=model,
+            max_tokens=ANTHROPIC_MAX_TOKENS,
+            system=[{
+                'type': 'text',
+                'text': system['content'],
+                'cache_control': {'type': 'ephemeral'},
+            }],
+            messages=messages,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+
+
+async def request_anthropic(
+    client: anthropic.AsyncAnthropic,
+    request: dict,
+) -> dict:
+    """
+    Ask to Anthropic and convert the response to the raw OpenAI format.
+
+    The system message is marked as an ephemeral cache breakpoint, so the next
+    requests read it from the Anthropic prompt cache. Anthropic does not
+    support `n`, so a request is done for each choice.
+
+    Args:
+        client (anthropic.AsyncAnthropic): The Anthropic client.
+        request (dict): The OpenAI request parameters (model, messages and n).
+
+    Returns:
+        dict: The raw response in the OpenAI format.
+    """
+    system, *messages = request['messages']
+    results = await asyncio.gather(*[
+        create_anthropic_message(client, request['model'], system, messages)
+        for _ in range(request['n'])
+    ])
+
+    usage = {
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'total_tokens': 0,
+        'cache_read_input_tokens': 0,
+    }
+    choices: list[dict] = []
+    for index,result in enumerate(results):
+        prompt_tokens = (
+            result.usage.input_tokens
+            + (result.usage.cache_creation_input_tokens or 0)
+            + (result.usage.cache_read_input_tokens or 0)
+        )
+        usage['prompt_tokens'] += prompt_tokens
+        usage['completion_tokens'] += result.usage.output_tokens
+        usage['total_tokens'] += prompt_tokens + result.usage.output_tokens
+        usage['cache_read_input_tokens'] += (
+            result.usage.cache_read_input_tokens or 0)
+        choices.append({
+            'message': {
+                'role': 'assistant',
+                'content': ''.join(
+                    block.text for block in result.content
+                    if block.type == 'text'
+                ),
+            },
+            'finish_reason': (
+                'length' if result.stop_reason == 'max_tokens' else 'stop'),
+            'index': index,
+        })
+
+    return {
+        'id': results[0].id,
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': results[0].model,
+        'usage': usage,
+        'choices': choices,
+    }
+
+
+@retry_transient_errors
+async def request_openai(request: dict) -> dict:
+    """
+    Do the chat request to OpenAI and return the raw response.
+
+    At most `MAX_CONCURRENCY` requests are in-flight at the same time, and the
+    transient errors are retried with an exponential backoff.
+    """
+    async with request_semaphore:
+        response = await async_client.chat.completions.create(
+            **request,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+    return response.model_dump()
+
+
+async def request_chat(
+    request: dict,
+    anthropic_client: Optional[anthropic.AsyncAnthropic] = None,
+) -> dict:
+    """
+    Do the chat request to OpenAI, or to Anthropic if its client is given, and
+    return the raw response.
+    """
+    if anthropic_client is None:
+        return await request_openai(request)
+    return await request_anthropic(anthropic_client, request)
+
+
+async def ask_openai_async(
+    prompt: str,
+    n: int = 1,
+    cache: Optional[ResponseCache] = None,
+    semantic_cache: Optional[SemanticCache] = None,
+    anthropic_client: Optional[anthropic.AsyncAnthropic] = None,
+    validate: Optional[Callable[[Response], bool]] = None,
+) -> Response:
+    """
+    Ask to OpenAI, or to Anthropic if its client is given.
+
+    If a cache is given, the cached response is returned instead of doing the
+    request. The semantic cache is only used when one choice is requested. If
+    `validate` is given, the responses that are not valid are neither cached
+    nor read from the cache.
+
+    Raises:
+        ValueError: If the response is truncated by the max tokens.
+    """
+    request = {
+        'model': MODEL if anthropic_client is None else ANTHROPIC_MODEL,
+        'messages': build_messages(prompt),
+        'n': n,
+    }
+    def is_valid(response: Response) -> bool:
+        return not response.truncated and (
+            validate is None or validate(response))
+
+    if cache is not None:
+        raw_response = cache.get(request)
+        if raw_response is not None:
+            response = Response.from_raw(raw_response)
+            if is_valid(response):
+                return response
+
+    embedding: Optional[np.ndarray] = None
+    if semantic_cache is not None and n == 1:
+        embedding = await embed_prompt(prompt)
+        raw_response = semantic_cache.get(
+            embedding,
+            request['model'],
+            SYSTEM_PROMPT,
+            get_prompt_task(prompt),
+        )
+        if raw_response is not None:
+            response = Response.from_raw(raw_response)
+            if is_valid(response):
+                return response
+
+    raw_response = await request_chat(request, anthropic_client)
+    response = Response.from_raw(raw_response)
+    if response.truncated:
+        raise ValueError('the response is truncated by the max tokens')
+    if not is_valid(response):
+        return response
+
+    if cache is not None:
+        cache.set(request, raw_response)
+    if embedding is not None:
+        semantic_cache.add(
+            embedding,
+            raw_response,
+            request['model'],
+            SYSTEM_PROMPT,
+            get_prompt_task(prompt),
+        )
+    return response
+
+
+@retry_transient_errors
+async def open_chat_stream(request: dict):
+    """
+    Do the chat request to OpenAI streaming the response, and return the
+    iterator of the chunks.
+
+    Only opening the stream is retried, so the printed deltas are not repeated.
+    """
+    return await async_client.chat.completions.create(
+        **request,
+        stream=True,
+        stream_options={'include_usage': True},
+        timeout=REQUEST_TIMEOUT_SECONDS,
+    )
+
+
+async def ask_openai_stream(
+    prompt: str,
+    cache: Optional[ResponseCache] = None,
+) -> Response:
+    """
+    Ask to OpenAI streaming the response, each delta is printed as soon as it
+    arrives.
+
+    The usage is taken from the last chunk, so the total tokens are still
+    counted. If a cache is given, the cached response is printed instead of
+    doing the request.
+    """
+    request = {'model': MODEL, 'messages': build_messages(prompt), 'n': 1}
+    raw_response = cache.get(request) if cache is not None else None
+    if raw_response is not None:
+        response = Response.from_raw(raw_response)
+        if not response.truncated:
+            sys.stdout.write(f'{response.contents[0]}\n\n')
+            return response
+
+    deltas: list[str] = []
+    usage: dict = {'total_tokens': 0}
+    finish_reason: Optional[str] = None
+    async for chunk in await open_chat_stream(request):
+        if chunk.usage is not None:
+            usage = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            if choice.finish_reason is not None:
+                finish_reason = choice.finish_reason
+            delta = choice.delta.content
+            if delta:
+                # Without rich, the content could contain markup
+                sys.stdout.write(delta)
+                sys.stdout.flush()
+                deltas.append(delta)
+    sys.stdout.write('\n\n')
+
+    raw_response = {
+        'usage': usage,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': ''.join(deltas)},
+            'finish_reason': finish_reason,
+        }],
+    }
+    response = Response.from_raw(raw_response)
+    if response.truncated:
+        raise ValueError('the response is truncated by the max tokens')
+    if cache is not None:
+        cache.set(request, raw_response)
     return response
 
 
+def build_merged_prompt(prompts: list[str]) -> str:
+    """Build a single prompt that contains all the given prompts numbered."""
+    return PROMPT_TO_MERGE.format(
+        count=len(prompts),
+        prompts='\n'.join(
+            f'{PROMPT_SECTION} {k + 1}\n{prompt}'
+            for k,prompt in enumerate(prompts)
+        ),
+    )
+
+
+def split_merged_response(response: str, count: int) -> list[Optional[str]]:
+    """
+    Split the response of a merged prompt in the answer of each prompt.
+
+    Args:
+        response (str): The response content.
+        count (int): The amount of merged prompts.
+
+    Returns:
+        list[Optional[str]]: The answer of each prompt, it is None if the
+                             response does not contain the section of that
+                             prompt.
+    """
+    contents: list[Optional[str]] = [None] * count
+    sections = REGEX_RESPONSE_SECTION.split(response)
+    # The split results are [preamble, number, content, number, content, ...]
+    for number,content in zip(sections[1::2], sections[2::2]):
+        k = int(number) - 1
+        if 0 <= k < count and content.strip():
+            contents[k] = content.strip()
+    return contents
+
+
+async def ask_openai_merged(
+    prompts: list[str],
+    cache: Optional[ResponseCache] = None,
+    anthropic_client: Optional[anthropic.AsyncAnthropic] = None,
+) -> list[Response | Exception]:
+    """
+    Ask to OpenAI for all the prompts in a single request.
+
+    If all the prompts are the same, `n` choices are requested. Otherwise the
+    prompts are numbered in a single message and the answer is split by
+    section. A truncated reply or a reply without all the sections is not
+    cached. The semantic cache is not used, since different merged prompts
+    look too similar.
+
+    Args:
+        prompts (list[str]): The prompts to ask.
+        cache (Optional[ResponseCache]): The cache of the responses.
+        anthropic_client (Optional[anthropic.AsyncAnthropic]): The Anthropic
+                                                  client to ask to it instead.
+
+    Returns:
+        list[Response | Exception]: A response with only one content for each
+                                    prompt, or the error if its section is
+                                    missing. The usage of the request is only
+                                    in the first result to not count the
+                                    tokens many times.
+    """
+    if len(set(prompts)) == 1:
+        response = await ask_openai_async(
+            prompts[0],
+            n=len(prompts),
+            cache=cache,
+            anthropic_client=anthropic_client,
+        )
+        contents: list[Optional[str]] = list(response.contents)
+    else:
+        response = await ask_openai_async(
+            build_merged_prompt(prompts),
+            cache=cache,
+            anthropic_client=anthropic_client,
+            validate=lambda response: (
+                not response.truncated
+                and None not in split_merged_response(
+                    response.contents[0],
+                    len(prompts),
+                )
+            ),
+        )
+        content, = response.contents
+        contents = split_merged_response(content, len(prompts))
+
+    results: list[Response | Exception] = []
+    for k,content in enumerate(contents):
+        if content is None:
+            results.append(ValueError(
+                f'the merged response has not the section '
+                f'"{RESPONSE_SECTION} {k + 1}"'))
+            continue
+        results.append(Response(
+            total_tokens=response.total_tokens if k == 0 else 0,
+            contents=[content],
+            cache_read_input_tokens=(
+                response.cache_read_input_tokens if k == 0 else 0),
+        ))
+    return results
+
+
+async def ask_openai_merged_groups(
+    prompts: list[str],
+    cache: Optional[ResponseCache] = None,
+    anthropic_client: Optional[anthropic.AsyncAnthropic] = None,
+) -> list[Response | Exception]:
+    """
+    Ask to OpenAI for all the prompts merging them in groups of at most
+    `MAX_MERGED_PROMPTS`, one request for each group.
+
+    Args:
+        prompts (list[str]): The prompts to ask.
+        cache (Optional[ResponseCache]): The cache of the responses.
+        anthropic_client (Optional[anthropic.AsyncAnthropic]): The Anthropic
+                                                  client to ask to it instead.
+
+    Returns:
+        list[Response | Exception]: The response or the error of each prompt,
+                                    it never raises the request errors.
+    """
+    groups = [
+        prompts[k:k + MAX_MERGED_PROMPTS]
+        for k in range(0, len(prompts), MAX_MERGED_PROMPTS)
+    ]
+    results = await asyncio.gather(
+        *[
+            ask_openai_merged(
+                group,
+                cache=cache,
+                anthropic_client=anthropic_client,
+            )
+            for group in groups
+        ],
+        return_exceptions=True,
+    )
+    # A failed request is the error of all the prompts of its group
+    responses: list[Response | Exception] = []
+    for group,result in zip(groups, results):
+        if isinstance(result, Exception):
+            responses.extend([result] * len(group))
+        else:
+            responses.extend(result)
+    return responses
+
+
 def parse_response(response: str) -> list[str]:
     """
     Split the response and return a list of responses.
     """
-    options = response.split('\n')
-    options = list(
-        map(lambda x: REGEX_ITEM.sub('', x).strip(),
-            filter(lambda x: bool(x.strip()), options)))
-    return options
+    return [
+        option
+        for line in response.split('\n')
+        if (option := REGEX_ITEM.sub('', line, count=1).strip())
+    ]
 
 
 def get_only_the_rune_name(rune_name: str) -> str:
     """Get only the rune name."""
-    if rune_name.startswith('RUNA'):
-        rune_name = rune_name[len('RUNA'):].strip()
-    return rune_name
+    return rune_name.removeprefix('RUNA').strip()
 
 
 def create_string_from_list(items: list[str]) -> str:
@@ -131,129 +775,436 @@ def create_string_from_list(items: list[str]) -> str:
              given list, each one is wrapped in double quotes and splited
             by comma.
     """
-    copied: str = ''
-    for i,item in enumerate(items):
-        copied += f'"{item}"'
-        if i < len(items) - 1:
-            copied += ','
-        copied += '\n'
-    return copied
+    if not items:
+        return ''
+    return ',\n'.join(f'"{item}"' for item in items) + '\n'
 
 
-def process_summaries(processment: Processment) -> Processment:
+def prepare_summaries(processment: Processment) -> Processment:
     """
-    Process and generate the summaries.
+    Prepare the prompts to generate the summaries.
     """
-    summaries: list[str] = []
     for i,alternative in enumerate(processment.rune_definition.alternatives):
         prompt = PROMPT_TO_SUMMARY.format(text=alternative)
         print(f'{i+1}: [cyan]{prompt}[/]\n\n')
-        confirmed: bool = inquirer.confirm('Ask to OpenAI for this prompt?')
-        if not confirmed:
-            print('[red]Ignored[/]')
-            continue
+        processment.prompts.append(prompt)
+    return processment
+
+
+def print_usage(response: Response) -> None:
+    """Print the used tokens of a response."""
+    print(f'Usage tokens: [bold blue]{response.total_tokens}[/]')
+    if response.cache_read_input_tokens:
+        print(f'Cached tokens: [bold blue]{response.cache_read_input_tokens}[/]')
+
+
+def copy_items(items: list[str], no_confirm: bool = False) -> None:
+    """
+    Copy the items to the clipboard if the user wants. When nothing is
+    confirmed they are printed instead, since each rune would replace the
+    clipboard content.
+    """
+    copied = create_string_from_list(items)
+    if no_confirm:
+        print(copied)
+        return
 
-        response = ask_openai(prompt)
-        print(f'Usage tokens: [bold blue]{response.usage.total_tokens}[/]')
-        processment.total_tokens += response.usage.total_tokens
+    will_copy = inquirer.confirm('Copy?', default=True)
+    if will_copy:
+        pyperclip.copy(copied)
+        print('[green]Copied![/]\n')
+
+
+def process_summaries(
+    processment: Processment,
+    responses: list[Response],
+    no_confirm: bool = False,
+) -> Processment:
+    """
+    Process the generated summaries.
+    """
+    summaries: list[str] = []
+    for response in responses:
+        print_usage(response)
+        processment.total_tokens += response.total_tokens
 
-        choice, = response.choices
-        content: str = choice.message.content
+        content: str
+        content, = response.contents
 
         print(f'{content}\n')
-        will_add = inquirer.confirm('Add?', default=True)
+        will_add = no_confirm or inquirer.confirm('Add?', default=True)
         if will_add:
             summaries.append(content)
             print('[green]Added![/]\n')
-        summaries.append(content)
+
+    if not summaries:
+        print('[red]No summaries[/]')
+        return processment
 
     # Print all the summaries
     print('Summaries:')
     for i,summary in enumerate(summaries):
         print(f'{i + 1} - {summary}\n')
 
-    will_copy = inquirer.confirm('Copy?', default=True)
-    if will_copy:
-        copied = create_string_from_list(summaries)
-        assert len(copied) > 0
-        pyperclip.copy(copied)
-        print('[green]Copied![/]\n')
+    copy_items(summaries, no_confirm=no_confirm)
     return processment
 
 
-def process_alternatives(processment: Processment) -> Processment:
+def prepare_alternatives(processment: Processment) -> Processment:
     """
-    Process and generate the alternatives.
+    Prepare the prompt to generate the alternatives.
     """
-    rune_name = get_only_the_rune_name(processment.rune_definition.rune_name)
     # Generate a prompt
-    prompt = PROMPT_TO_GENERATE.format(
-        rune_name=rune_name,
-        invert=(
-            ' invertida'
-            if processment.rune_definition.type == 'invert'
-            else ''
-            ),
-        text=processment.rune_definition.description,
-    )
+    prompt = build_alternatives_prompt(processment.rune_definition)
 
     print(f'[cyan]{prompt}[/]\n\n')
-    confirmed: bool = inquirer.confirm('Ask to OpenAI for this prompt?')
-    if not confirmed:
-        print('[red]Ignored[/]')
-        return processment
+    processment.prompts.append(prompt)
+    return processment
+
 
-    # Do the request for this prompt and add the total token amount
-    response = ask_openai(prompt)
-    print(f'Usage tokens: [bold blue]{response.usage.total_tokens}[/]')
-    processment.total_tokens += response.usage.total_tokens
+def process_alternatives(
+    processment: Processment,
+    responses: list[Response],
+    no_confirm: bool = False,
+) -> Processment:
+    """
+    Process the generated alternatives.
+    """
+    # Add the total token amount of the response for the prompt
+    response, = responses
+    print_usage(response)
+    processment.total_tokens += response.total_tokens
 
-    choice, = response.choices
-    content: str = choice.message.content
+    content: str
+    content, = response.contents
     items = parse_response(content)
+    if not items:
+        print('[red]No items[/]')
+        return processment
 
     print('Items:')
     for i,item in enumerate(items):
         print(i + 1, '-', item)
         print()
 
-    will_copy = inquirer.confirm('Copy?', default=True)
-    if will_copy:
-        copied = create_string_from_list(items)
-        pyperclip.copy(copied)
-        print('[green]Copied![/]\n')
-
+    copy_items(items, no_confirm=no_confirm)
     return processment
 
 
-def main():
-    """The main function"""
-    # Get the args to get the target path
-    args = get_args()
+def create_batch_requests(rune_definitions: list[RuneDefinition]) -> list[dict]:
+    """
+    Create the Batch API requests for all the rune definitions that are missing
+    the alternatives or the summaries.
+
+    Args:
+        rune_definitions (list[RuneDefinition]): The loaded rune definitions.
+
+    Returns:
+        list[dict]: The requests, the custom ID is `alt-{i}` for the
+                    alternatives and `sum-{i}-{j}` for the summaries, where `i`
+                    is the rune index and `j` the alternative index.
+    """
+    requests: list[dict] = []
+    for i,rune_definition in enumerate(rune_definitions):
+        if not rune_definition.alternatives:
+            prompts = {f'alt-{i}': build_alternatives_prompt(rune_definition)}
+        elif not rune_definition.summaries:
+            prompts = {
+                f'sum-{i}-{j}': PROMPT_TO_SUMMARY.format(text=alternative)
+                for j,alternative in enumerate(rune_definition.alternatives)
+            }
+        else:
+            continue
+
+        # The body is the same request that ask_openai_async caches
+        for custom_id,prompt in prompts.items():
+            requests.append({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': MODEL,
+                    'messages': build_messages(prompt),
+                    'n': 1,
+                },
+            })
+    return requests
+
+
+@retry_transient_errors
+def upload_batch_file(batch_path: pathlib.Path) -> str:
+    """Upload the Batch API requests file and return its file ID."""
+    # The file is opened again in each attempt to upload it from the start
+    with batch_path.open('rb') as file:
+        return client.files.create(file=file, purpose='batch').id
+
+
+def run_batch(
+    requests: list[dict],
+    batch_path: pathlib.Path,
+    cache: Optional[ResponseCache] = None,
+) -> dict[str, Response]:
+    """
+    Submit the requests to the OpenAI Batch API and wait for the results.
+
+    Args:
+        requests (list[dict]): The Batch API requests.
+        batch_path (pathlib.Path): The JSONL file path where the requests are
+                                   written before uploading them.
+        cache (Optional[ResponseCache]): The cache where the succeeded
+                                         responses are saved.
+
+    Returns:
+        dict[str, Response]: The responses indexed by the request custom ID.
+
+    Raises:
+        RuntimeError: If the batch ends without being completed.
+    """
+    batch_path.write_text(
+        ''.join(json.dumps(request) + '\n' for request in requests),
+        encoding='utf-8',
+    )
+    input_file_id = upload_batch_file(batch_path)
+
+    batch = retry_transient_errors(client.batches.create)(
+        input_file_id=input_file_id,
+        endpoint='/v1/chat/completions',
+        completion_window='24h',
+    )
+    print(f'Batch created: [bold]{batch.id}[/]')
+
+    while batch.status != 'completed':
+        if batch.status in ('failed', 'expired', 'cancelled'):
+            raise RuntimeError(f'batch {batch.id} is {batch.status}')
+        print(f'Batch status: [yellow]{batch.status}[/]')
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = retry_transient_errors(client.batches.retrieve)(batch.id)
+
+    # The succeeded requests are in the output file and the failed ones in
+    # the error file, any of them is missing if it would be empty
+    bodies = {request['custom_id']: request['body'] for request in requests}
+    responses: dict[str, Response] = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id is None:
+            continue
+        output = retry_transient_errors(client.files.content)(file_id)
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                error = result.get('error') or response.get('body', {}).get(
+                    'error')
+                print(f'[red]{result["custom_id"]}: {error}[/]')
+                continue
+            batch_response = Response.from_raw(response['body'])
+            if batch_response.truncated:
+                print(f'[red]{result["custom_id"]}: the response is truncated '
+                      f'by the max tokens[/]')
+                continue
+            responses[result['custom_id']] = batch_response
+            if cache is not None:
+                cache.set(bodies[result['custom_id']], response['body'])
+    return responses
+
+
+def process_batch(
+    rune_definitions: list[RuneDefinition],
+    target_path: str,
+    cache: Optional[ResponseCache] = None,
+) -> int:
+    """
+    Generate the missing alternatives and summaries with the OpenAI Batch API
+    and print them.
+
+    If a cache is given, the cached responses are not submitted again and the
+    batch results are saved in it, so the next runs reuse them.
+
+    Returns:
+        int: The total of used tokens.
+    """
+    requests = create_batch_requests(rune_definitions)
+    responses: dict[str, Response] = {}
+    if cache is not None:
+        for request in requests:
+            raw_response = cache.get(request['body'])
+            if raw_response is None:
+                continue
+            response = Response.from_raw(raw_response)
+            if not response.truncated:
+                responses[request['custom_id']] = response
+        requests = [
+            request
+            for request in requests
+            if request['custom_id'] not in responses
+        ]
+    if requests:
+        batch_path = pathlib.Path(target_path).with_suffix('.batch.jsonl')
+        responses.update(run_batch(requests, batch_path, cache=cache))
+
     total_tokens: int = 0
+    for i,rune_definition in enumerate(rune_definitions):
+        if f'alt-{i}' in responses:
+            title = 'Items'
+            found = [responses[f'alt-{i}']]
+            items = parse_response(found[0].contents[0])
+        else:
+            title = 'Summaries'
+            found = [
+                responses[f'sum-{i}-{j}']
+                for j in range(len(rune_definition.alternatives or []))
+                if f'sum-{i}-{j}' in responses
+            ]
+            items = [response.contents[0] for response in found]
+        if not found:
+            continue
+
+        total_tokens += sum(response.total_tokens for response in found)
+        print(f'[bold green]{i}[/] - {title}:\n')
+        print(create_string_from_list(items))
+
+    return total_tokens
+
+
+def get_cache_directory(target_path: str) -> pathlib.Path:
+    """Get the cache directory of the target file."""
+    return CACHE_DIRECTORY / pathlib.Path(target_path).stem
+
 
-    # Set the OpenAI key
-    openai.api_key = OPENAI_API_KEY
+def get_cache(args: argparse.Namespace) -> Optional[ResponseCache]:
+    """Get the responses cache of the target file, unless it is disabled."""
+    if args.no_cache:
+        return None
+    return ResponseCache(get_cache_directory(args.target_path))
+
+
+def main_batch(args: argparse.Namespace):
+    """
+    The main function of the batch mode, it is not async since it only waits
+    for the batch.
+    """
+    rune_definitions = load_json_file(args.target_path)
+    print(f'{len(rune_definitions)} loaded')
+
+    total_tokens = process_batch(
+        rune_definitions,
+        args.target_path,
+        cache=get_cache(args),
+    )
+    print(f'tokens: [bold blue]{total_tokens}[/]')
+
+
+async def main_async(args: argparse.Namespace):
+    """The main function"""
+    total_tokens: int = 0
 
     # Get the rune definitions & filter whih does not have alternatives
     rune_definitions = load_json_file(args.target_path)
     print(f'{len(rune_definitions)} loaded')
 
-    # Iterate for each rune definition and generate the prompt
+    # Iterate for each rune definition and prepare the prompts
+    processments: dict[int, Processment] = {}
     for i,rune_definition in enumerate(rune_definitions):
-        processment = Processment(rune_definition=rune_definition)
         if rune_definition.alternatives and rune_definition.summaries:
             continue
 
-        print(f'[bold green]{i}[/] -:\n')
+        # Ask before building the prompts, so the ignored runes cost nothing
+        task = 'summaries' if rune_definition.alternatives else 'alternatives'
+        print(f'[bold green]{i}[/] - {rune_definition.rune_name}:\n')
+        confirmed: bool = args.no_confirm or inquirer.confirm(
+            f'Ask to OpenAI for the {task} of this rune?')
+        if not confirmed:
+            print('[red]Ignored[/]')
+            continue
 
+        processment = Processment(rune_definition=rune_definition)
         # Check if missing the alternatives
         if not processment.rune_definition.alternatives:
-            processment = process_alternatives(processment)
+            processment = prepare_alternatives(processment)
         # Check if missing the summaries
-        if processment.rune_definition.alternatives and \
-            not processment.rune_definition.summaries:
-            processment = process_summaries(processment)
+        else:
+            processment = prepare_summaries(processment)
+
+        if processment.prompts:
+            processments[i] = processment
+
+    # Ask all the prompts concurrently, in only one request, or later one by
+    # one while streaming
+    cache = get_cache(args)
+    semantic_cache: Optional[SemanticCache] = None
+    if cache is not None and args.semantic_cache and not args.anthropic:
+        semantic_cache = SemanticCache(get_cache_directory(args.target_path))
+    anthropic_client: Optional[anthropic.AsyncAnthropic] = None
+    if args.anthropic:
+        anthropic_client = anthropic.AsyncAnthropic(max_retries=0)
+    prompts = [
+        prompt
+        for processment in processments.values()
+        for prompt in processment.prompts
+    ]
+    if args.stream:
+        responses = iter(())
+    elif args.merge:
+        responses = iter(await ask_openai_merged_groups(
+            prompts,
+            cache=cache,
+            anthropic_client=anthropic_client,
+        ))
+    else:
+        responses = iter(await asyncio.gather(
+            *[
+                ask_openai_async(
+                    prompt,
+                    cache=cache,
+                    semantic_cache=semantic_cache,
+                    anthropic_client=anthropic_client,
+                )
+                for prompt in prompts
+            ],
+            return_exceptions=True,
+        ))
+    if semantic_cache is not None:
+        semantic_cache.save()
+
+    # Distribute the responses to each rune definition by index
+    for i,processment in processments.items():
+        print(f'[bold green]{i}[/] -:\n')
+        if args.stream:
+            rune_responses = []
+            for prompt in processment.prompts:
+                try:
+                    rune_responses.append(
+                        await ask_openai_stream(prompt, cache=cache))
+                except Exception as err:
+                    rune_responses.append(err)
+        else:
+            rune_responses = list(
+                itertools.islice(responses, len(processment.prompts)))
+        # Report the failed prompts and process only the succeeded ones
+        for k,response in enumerate(rune_responses):
+            if isinstance(response, Exception):
+                print(f'[red]{k + 1}: {response}[/]')
+        rune_responses = [
+            response
+            for response in rune_responses
+            if not isinstance(response, Exception)
+        ]
+        if not rune_responses:
+            continue
+
+        if not processment.rune_definition.alternatives:
+            processment = process_alternatives(
+                processment,
+                rune_responses,
+                no_confirm=args.no_confirm,
+            )
+        else:
+            processment = process_summaries(
+                processment,
+                rune_responses,
+                no_confirm=args.no_confirm,
+            )
 
         # Add the total of tokens
         total_tokens += processment.total_tokens
@@ -262,5 +1213,15 @@ def main():
     print(f'tokens: [bold blue]{total_tokens}[/]')
 
 
+def main():
+    """Run the batch mode, or the main function in the event loop."""
+    # Get the args to get the target path
+    args = get_args()
+    if args.batch:
+        main_batch(args)
+        return
+    asyncio.run(main_async(args))
+
+
 if __name__ == '__main__':
     main()
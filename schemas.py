@@ -2,56 +2,56 @@
 Schemas
 """
 
-from typing import Literal, Optional, Union
+from dataclasses import dataclass, field
+from typing import Literal
 
 from pydantic import BaseModel
 
 
-Role = Union[Literal['user'], Literal['system'], Literal['assistant']]
+Role = Literal['user', 'system', 'assistant']
 
 
 class RuneDefinition(BaseModel):
     """RuneDefinition."""
     rune_name: str
     description: str
-    type: Union[Literal['normal'], Literal['invert']]
-    alternatives: Optional[list[str]]
-    summaries: Optional[list[str]]
+    type: Literal['normal', 'invert']
+    alternatives: list[str] | None = None
+    summaries: list[str] | None = None
 
 
-class Message(BaseModel):
-    """Message."""
-    role: Role
-    content: str
-
-
-class Choice(BaseModel):
-    """Choice."""
-    message: Message
-    finish_reason: Union[
-        Literal['stop'],
-        Literal['length'],
-        Literal['content_filter'],
-        None,
-    ]
-    index: int
-
-
-class Usage(BaseModel):
-    """Usage."""
-    prompt_tokens: int
-    completion_tokens: int
+@dataclass(slots=True)
+class Response:
+    """
+    Response, only with the fields that are used from the raw chat completion.
+    """
     total_tokens: int
-
-
-class Response(BaseModel):
-    """Response."""
-    id: str
-    object: str
-    created: int
-    model: str
-    usage: Usage
-    choices: list[Choice]
+    contents: list[str]
+    cache_read_input_tokens: int = 0
+    finish_reasons: list[str | None] = field(default_factory=list)
+
+    @property
+    def truncated(self) -> bool:
+        """If any choice was cut by the max tokens."""
+        return 'length' in self.finish_reasons
+
+    @classmethod
+    def from_raw(cls, raw_response: dict) -> 'Response':
+        """Create a Response from the raw chat completion."""
+        usage = raw_response['usage']
+        choices = sorted(raw_response['choices'], key=lambda c: c['index'])
+        # OpenAI reports the cached tokens in the prompt tokens details
+        prompt_tokens_details = usage.get('prompt_tokens_details') or {}
+        return cls(
+            total_tokens=usage['total_tokens'],
+            contents=[choice['message']['content'] for choice in choices],
+            cache_read_input_tokens=(
+                usage.get('cache_read_input_tokens')
+                or prompt_tokens_details.get('cached_tokens')
+                or 0
+            ),
+            finish_reasons=[choice.get('finish_reason') for choice in choices],
+        )
 
 
 class Prompt(BaseModel):
@@ -63,4 +63,5 @@ class Prompt(BaseModel):
 class Processment(BaseModel):
     """Processment."""
     rune_definition: RuneDefinition
+    prompts: list[str] = []
     total_tokens: int = 0
@@ -0,0 +1,210 @@
+"""
+Semantic cache
+"""
+
+import hashlib
+import pathlib
+from typing import Optional
+
+import numpy as np
+import orjson
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+DEFAULT_THRESHOLD = 0.92
+
+# Under this amount of entries the NumPy search is fast enough
+FAISS_MIN_ENTRIES = 10_000
+
+# Amount of best FAISS results checked for an entry of the same key
+FAISS_SEARCH_K = 32
+
+# Amount of new entries before the embeddings are saved again
+SAVE_EVERY = 100
+
+
+class SemanticCache:
+    """
+    A disk cache of the raw OpenAI responses that are found by the cosine
+    similarity of the prompt embeddings, so the paraphrased prompts use the
+    same response.
+
+    The embeddings are saved in `sem.npz` and the responses in `sem.jsonl`,
+    both in the same order. Each response is saved with the hash of its model,
+    system prompt and task, and only the entries with the same hash are found.
+    Each response is used at most once by the instance, so the paraphrased
+    prompts of the same run (like the summaries of the alternatives of a rune)
+    do not get the same response.
+
+    The new responses are appended to `sem.jsonl` when they are added, but the
+    embeddings are only saved every `SAVE_EVERY` entries, so `save()` must be
+    called at the end.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        threshold: float = DEFAULT_THRESHOLD,
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.vectors_path = directory / 'sem.npz'
+        self.responses_path = directory / 'sem.jsonl'
+        self.vectors: Optional[np.ndarray] = None
+        self.responses: list[dict] = []
+        self.keys: list[str] = []
+        self._used: set[int] = set()
+        self._pending: list[np.ndarray] = []
+        self._index = None
+        self.load()
+
+    def load(self) -> None:
+        """Load the saved embeddings and responses."""
+        if not self.responses_path.exists():
+            return
+        vectors = (
+            np.load(self.vectors_path)['vectors']
+            if self.vectors_path.exists()
+            else np.empty((0, 0), dtype=np.float32)
+        )
+        lines = [
+            line
+            for line in self.responses_path.read_bytes().splitlines()
+            if line.strip()
+        ]
+        # Keep only the complete entries if the run was interrupted, and drop
+        # the lines without embeddings so the next ones are appended in order
+        size = min(len(vectors), len(lines))
+        if len(lines) > size:
+            self.responses_path.write_bytes(b''.join(
+                line + b'\n' for line in lines[:size]
+            ))
+        entries = [orjson.loads(line) for line in lines[:size]]
+        self.vectors = vectors[:size] if size else None
+        self.responses = [entry.get('response') for entry in entries]
+        # The entries saved without a key are never found
+        self.keys = [entry.get('key', '') for entry in entries]
+
+    def save(self) -> None:
+        """Save the embeddings, the responses are already appended."""
+        if self._vectors() is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        np.savez(self.vectors_path, vectors=self.vectors)
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, task: str) -> str:
+        """Get the hash of the model, system prompt and task of the entries."""
+        return hashlib.sha256(
+            f'{model}\n{task}\n{system_prompt}'.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def normalize(embedding: np.ndarray) -> np.ndarray:
+        """Normalize the embedding, so the dot product is the cosine."""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def _vectors(self) -> Optional[np.ndarray]:
+        """Get all the embeddings, joining the ones added since the last call."""
+        if self._pending:
+            pending = np.concatenate(self._pending)
+            self._pending = []
+            if self.vectors is None:
+                self.vectors = pending
+            else:
+                self.vectors = np.concatenate([self.vectors, pending])
+            if self._index is not None:
+                self._index.add(pending)
+        return self.vectors
+
+    def _search(self, embedding: np.ndarray, key: str) -> tuple[float, int]:
+        """
+        Get the best similarity of the unused entries with the key and the
+        index of its entry, or -1 if there is not such an entry.
+        """
+        vectors = self._vectors()
+        if faiss is not None and len(self.responses) >= FAISS_MIN_ENTRIES:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vectors.shape[1])
+                self._index.add(vectors)
+            similarities, indexes = self._index.search(
+                embedding[None, :], FAISS_SEARCH_K)
+            for similarity, index in zip(similarities[0], indexes[0]):
+                if (
+                    index >= 0
+                    and self.keys[index] == key
+                    and index not in self._used
+                ):
+                    return float(similarity), int(index)
+            return -1.0, -1
+        similarities = vectors @ embedding
+        similarities[np.asarray(self.keys) != key] = -np.inf
+        similarities[list(self._used)] = -np.inf
+        index = int(similarities.argmax())
+        if similarities[index] == -np.inf:
+            return -1.0, -1
+        return float(similarities[index]), index
+
+    def get(
+        self,
+        embedding: np.ndarray,
+        model: str,
+        system_prompt: str,
+        task: str,
+    ) -> Optional[dict]:
+        """
+        Get the cached raw response of the most similar prompt.
+
+        Args:
+            embedding (np.ndarray): The embedding of the prompt.
+            model (str): The model of the request.
+            system_prompt (str): The system prompt of the request.
+            task (str): The task of the prompt.
+
+        Returns:
+            Optional[dict]: The raw response, or None if there is not a prompt
+                            similar enough.
+        """
+        if not self.responses:
+            return None
+        similarity, index = self._search(
+            self.normalize(embedding),
+            self.make_key(model, system_prompt, task),
+        )
+        if index < 0 or similarity < self.threshold:
+            return None
+        self._used.add(index)
+        return self.responses[index]
+
+    def add(
+        self,
+        embedding: np.ndarray,
+        raw_response: dict,
+        model: str,
+        system_prompt: str,
+        task: str,
+    ) -> None:
+        """
+        Add the raw response of the prompt, appending it to the responses file.
+
+        Args:
+            embedding (np.ndarray): The embedding of the prompt.
+            raw_response (dict): The raw response to save.
+            model (str): The model of the request.
+            system_prompt (str): The system prompt of the request.
+            task (str): The task of the prompt.
+        """
+        key = self.make_key(model, system_prompt, task)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.responses_path.open('ab') as file:
+            file.write(orjson.dumps({'key': key, 'response': raw_response}))
+            file.write(b'\n')
+        self._pending.append(self.normalize(embedding)[None, :])
+        self.responses.append(raw_response)
+        self.keys.append(key)
+        self._used.add(len(self.responses) - 1)
+        if len(self._pending) >= SAVE_EVERY:
+            self.save()